@@ -1,20 +1,24 @@
 import time
 import logging
+import os
 import socket
 import sys
 from kafka import KafkaConsumer, KafkaProducer
 from kafka.errors import KafkaError  
-import json
+import orjson
 import numpy as np
 from dataclasses import dataclass
 from typing import Dict, Tuple
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @dataclass
 class Taxi:
+    # __slots__ a mano: dataclass(slots=True) requiere Python 3.10 y la imagen usa 3.9
+    __slots__ = ('id', 'status', 'color', 'position', 'customer_assigned', 'picked_off', 'auth_status', 'stopped')
     id: int
     status: str  
     color: str  
@@ -22,7 +26,7 @@ class Taxi:
     customer_assigned: str
     picked_off: int
     auth_status: int
-    stopped: bool = False
+    stopped: bool  # Con __slots__ no se puede usar un valor por defecto
 
 @dataclass
 class Customer:
@@ -35,6 +39,7 @@ class Customer:
 
 @dataclass
 class Location:
+    __slots__ = ('id', 'position', 'color')
     id: str
     position: Tuple[int, int]
     color: str 
@@ -46,13 +51,47 @@ class ECCentral:
         self.producer = None
         self.consumer = None
         self.map_size = (20, 20)
-        self.map = np.full(self.map_size, ' ', dtype=str)
+        # Buffer de texto del mapa: cada celda ocupa 2 bytes y cada fila termina en '#\n'
+        self._map_row_len = self.map_size[1] * 2 + 3
+        border_row = b'#' * (self.map_size[1] * 2 + 2) + b'\n'
+        empty_row = b'#' + b' ' * (self.map_size[1] * 2) + b'#\n'
+        self._blank_template = border_row + empty_row * self.map_size[0] + border_row
+        self._map_buf = bytearray(self._blank_template)
+        self.last_screen = None  # Último mapa y tabla mostrados en la consola
         self.locations: Dict[str, Location] = {}
         self.taxis_file = '/data/taxis.txt'  
         self.taxis: Dict[int, Taxi] = {}  
+        # Posiciones y etiquetas de los taxis en arrays (un índice por taxi) para dibujar el mapa vectorizado
+        self.taxi_index: Dict[int, int] = {}
+        self.taxi_x = np.zeros(0, dtype=np.intp)
+        self.taxi_y = np.zeros(0, dtype=np.intp)
+        self.taxi_label = np.zeros((0, 2), dtype=np.uint8)
+        self.taxi_visible = np.zeros(0, dtype=bool)
+        # Protege los campos de los Taxi (estado, posición, autenticación, parada) y los arrays del mapa.
+        # Toda modificación de un taxi debe hacerse con este lock; no se mantiene durante E/S ni esperas.
+        self.taxis_lock = threading.Lock()
+        self.taxis_dirty = threading.Event()  # Indica que hay cambios pendientes de guardar en fichero
+        self.taxis_save_delay = 0.05  # Segundos que se agrupan escrituras antes de guardar
+        self.taxis_stop = threading.Event()  # Pide al hilo de persistencia que guarde lo pendiente y termine
+        self.persistence_thread = None
         self.customers: Dict[int, Customer] = {}
         self.customer_destinations = {}
-        self.map_changed = False  
+        # Acciones adicionales según el estado recibido en 'taxi_updates'
+        self.status_handlers = {
+            'END': self.finalize_trip,
+        }
+        self.auth_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='taxi-auth')
+        self.auth_timeout = 5  # Segundos máximos para recibir el ID del taxi al autenticar
+        self.map_dirty = threading.Event()  # Se activa cuando el mapa cambia y hay que reenviarlo
+        self.map_coalesce_delay = 0.02  # Segundos que se agrupan cambios antes de redibujar
+        # Fragmento JSON de las localizaciones y la versión de self.locations con la que se generó.
+        # Quien modifique self.locations debe incrementar locations_version.
+        self.locations_version = 0
+        self.locations_json = None
+        self.locations_json_version = -1
+        # Versión del mapa: (epoch, seq) crece con cada cambio, también tras reiniciar la central
+        self.map_epoch = time.time_ns()
+        self.map_seq = 0
         self.setup_kafka()
 
     def setup_kafka(self):
@@ -62,18 +101,33 @@ class ECCentral:
                 
                 self.producer = KafkaProducer(
                     bootstrap_servers=[self.kafka_bootstrap_servers],
-                    value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-                    retries=3
+                    # Los payloads ya serializados (bytes) se envían tal cual
+                    value_serializer=lambda v: v if isinstance(v, bytes) else orjson.dumps(v, option=orjson.OPT_NON_STR_KEYS),
+                    retries=3,
+                    acks='all',
+                    linger_ms=10,  # Agrupar mensajes pequeños en un mismo batch
+                    batch_size=65536,
+                    compression_type='lz4',
+                    buffer_memory=33554432
                 )
                 logger.info("Kafka producer set up successfully")
 
-               
+                # Cerrar el consumidor anterior al reconectar para no mantener dos en el grupo
+                if self.consumer:
+                    try:
+                        self.consumer.close()
+                    except Exception as e:
+                        logger.warning(f"Error closing previous Kafka consumer: {e}")
+
                 self.consumer = KafkaConsumer(
                     'taxi_updates','taxi_requests',
                     bootstrap_servers=[self.kafka_bootstrap_servers],
-                    value_deserializer=lambda v: json.loads(v.decode('utf-8')),
+                    value_deserializer=orjson.loads,
                     group_id='central-group',
-                    auto_offset_reset='latest'
+                    auto_offset_reset='latest',
+                    fetch_min_bytes=16384,
+                    fetch_max_wait_ms=50,
+                    max_poll_records=500
                 )
                 logger.info("Kafka consumer set up successfully")
                 return
@@ -89,11 +143,18 @@ class ECCentral:
     def load_map_config(self):
         try:
             with open('/data/map_config.txt', 'r') as f:
-                for line in f:
-                    loc_id, x, y = line.strip().split()
-                    x, y = int(x), int(y)
+                data = f.read()
+            for line_number, line in enumerate(data.splitlines(), start=1):
+                if line.strip():
+                    # Cada línea tiene 3 campos: id x y
+                    try:
+                        loc_id, x, y = line.split()
+                        x, y = int(x), int(y)
+                    except ValueError:
+                        logger.warning(f"Invalid line {line_number} in map configuration file (expected 'id x y'). Skipping.")
+                        continue
                     self.locations[loc_id] = Location(loc_id, (x, y), "BLUE")
-                    self.map[y - 1, x - 1] = loc_id  # Ajuste del índice para la matriz
+            self.locations_version += 1
             logger.info("Map configuration loaded successfully.")
         except Exception as e:
             logger.error(f"Error loading map configuration: {e}")
@@ -104,60 +165,129 @@ class ECCentral:
         self.taxis = {}  # Asegurar que sea un diccionario vacío antes de cargar
         try:
             with open(self.taxis_file, 'r') as f:
-                for line in f:
-                    taxi_id, status, color, pos_x, pos_y, customer_assigned, picked_off, auth_status = line.strip().split('#')
-                    self.taxis[int(taxi_id)] = Taxi(
-                        id=int(taxi_id),
-                        status=status,
-                        color=color,
-                        position=(int(pos_x), int(pos_y)),
-                        customer_assigned=customer_assigned,
-                        picked_off=int(picked_off),
-                        auth_status=int(auth_status)
-                    )
+                data = f.read()
+            for line_number, line in enumerate(data.splitlines(), start=1):
+                if line.strip():
+                    # Cada línea tiene 8 campos: id#estado#color#x#y#cliente#recogido#autenticado
+                    try:
+                        taxi_id, status, color, pos_x, pos_y, customer_assigned, picked_off, auth_status = line.strip().split('#')
+                        taxi = Taxi(
+                            id=int(taxi_id),
+                            status=status,
+                            color=color,
+                            position=(int(pos_x), int(pos_y)),
+                            customer_assigned=customer_assigned,
+                            picked_off=int(picked_off),
+                            auth_status=int(auth_status),
+                            stopped=False
+                        )
+                    except ValueError:
+                        logger.warning(f"Invalid line {line_number} in taxis file (expected 8 '#'-separated fields with integer id, position, picked_off and auth_status). Skipping.")
+                        continue
+                    self.taxis[taxi.id] = taxi
             logger.info("Taxis loaded successfully.")
         except FileNotFoundError:
             logger.warning("Taxis file not found. Starting with an empty list.")
         except Exception as e:
             logger.error(f"Error loading taxis from file: {e}")
+        self.build_taxi_arrays()
+
+    def build_taxi_arrays(self):
+        """Crea los arrays de posiciones y etiquetas de los taxis a partir de self.taxis."""
+        n = len(self.taxis)
+        self.taxi_index = {taxi_id: i for i, taxi_id in enumerate(self.taxis)}
+        self.taxi_x = np.zeros(n, dtype=np.intp)
+        self.taxi_y = np.zeros(n, dtype=np.intp)
+        self.taxi_label = np.full((n, 2), ord(' '), dtype=np.uint8)
+        self.taxi_visible = np.zeros(n, dtype=bool)
+        for taxi in self.taxis.values():
+            self.update_taxi_cell(taxi)
+
+    def update_taxi_cell(self, taxi):
+        """Actualiza la posición y la etiqueta del taxi en los arrays del mapa."""
+        i = self.taxi_index[taxi.id]
+        self.taxi_x[i], self.taxi_y[i] = taxi.position
+        if taxi.status == "DOWN":
+            label = "X"
+        elif taxi.auth_status == 1:
+            label = str(taxi.id)
+        else:
+            label = ""
+        self.taxi_visible[i] = bool(label)
+        self.taxi_label[i] = np.frombuffer(label.encode('ascii')[:2].ljust(2), dtype=np.uint8)
 
     def save_taxis(self):
-        """Guarda los taxis en el fichero."""
+        """Marca los taxis como modificados; el hilo de persistencia los guardará en el fichero."""
+        self.taxis_dirty.set()
+
+    def write_taxis_file(self):
+        """Guarda los taxis en el fichero con una única escritura y reemplazo atómico."""
+        with self.taxis_lock:
+            lines = [
+                f"{taxi.id}#{taxi.status}#{taxi.color}#{taxi.position[0]}#{taxi.position[1]}#{taxi.customer_assigned}#{taxi.picked_off}#{taxi.auth_status}\n"
+                for taxi in self.taxis.values()
+            ]
+        # Nombre temporal único por proceso e hilo para que dos escrituras no compartan fichero
+        tmp_file = f"{self.taxis_file}.{os.getpid()}.{threading.get_ident()}.tmp"
         try:
-            with open(self.taxis_file, 'w') as f:
-                for taxi in self.taxis.values():
-                    f.write(f"{taxi.id}#{taxi.status}#{taxi.color}#{taxi.position[0]}#{taxi.position[1]}#{taxi.customer_assigned}#{taxi.picked_off}#{taxi.auth_status}\n")
+            with open(tmp_file, 'w') as f:
+                f.write("".join(lines))
+            os.replace(tmp_file, self.taxis_file)
         except Exception as e:
             logger.error(f"Error saving taxis to file: {e}")
 
+    def taxi_persistence_loop(self):
+        """Agrupa los cambios de los taxis y los guarda en el fichero en segundo plano."""
+        while True:
+            self.taxis_dirty.wait()
+            if not self.taxis_stop.is_set():
+                time.sleep(self.taxis_save_delay)
+            self.taxis_dirty.clear()
+            self.write_taxis_file()
+            # Al parar, salir solo cuando no queden cambios sin guardar
+            if self.taxis_stop.is_set() and not self.taxis_dirty.is_set():
+                return
+
+    def stop_taxi_persistence(self, timeout=5.0):
+        """Detiene el hilo de persistencia esperando a que guarde los últimos cambios."""
+        if self.persistence_thread and self.persistence_thread.is_alive():
+            self.taxis_stop.set()
+            self.taxis_dirty.set()  # Despertar el hilo para que haga la última escritura
+            self.persistence_thread.join(timeout)
+
     def handle_taxi_auth(self, conn, addr):
         """Maneja la autenticación del taxi."""
         logger.info(f"Connection from taxi at {addr}")
         try:
+            conn.settimeout(self.auth_timeout)
             data = conn.recv(1024).decode('utf-8')
             taxi_id = int(data.strip())
 
             if taxi_id in self.taxis:
                 # Actualizar estado y autenticación del taxi
-                taxi = self.taxis[taxi_id]
-                taxi.status = "FREE"
-                taxi.color = "RED"
-                taxi.position = (1, 1)
-                taxi.customer_assigned = "x"
-                taxi.picked_off = 0
-                taxi.auth_status = 1
+                with self.taxis_lock:
+                    taxi = self.taxis[taxi_id]
+                    taxi.status = "FREE"
+                    taxi.color = "RED"
+                    taxi.position = (1, 1)
+                    taxi.customer_assigned = "x"
+                    taxi.picked_off = 0
+                    taxi.auth_status = 1
+                    self.update_taxi_cell(taxi)
                 self.save_taxis()
                 logger.info(f"Taxi {taxi_id} authenticated successfully.")
                 conn.sendall(b"OK")
-                self.listen_to_taxi(taxi_id, conn)
+                conn.settimeout(None)
+                # La sesión dura mientras el taxi esté conectado: se atiende en su propio hilo para no ocupar el pool
+                threading.Thread(target=self.listen_to_taxi, args=(taxi_id, conn), daemon=True).start()
+                return
             else:
                 logger.warning(f"Taxi {taxi_id} is not in the database.")
                 conn.sendall(b"NOT_FOUND")
 
         except Exception as e:
             logger.error(f"Error during taxi authentication: {e}")
-        finally:
-            conn.close()
+        conn.close()
 
     def listen_to_taxi(self, taxi_id, conn):
         """Escucha mensajes de un taxi autenticado."""
@@ -168,8 +298,9 @@ class ECCentral:
                     logger.info(f"Taxi {taxi_id} has disconnected. Marking as KO.")
                     if taxi_id in self.taxis:
                         taxi = self.taxis[taxi_id]
-                        taxi.status = "KO"
-                        taxi.auth_status = 1  # Mantener autenticación
+                        with self.taxis_lock:
+                            taxi.status = "KO"
+                            taxi.auth_status = 1  # Mantener autenticación
                         self.save_taxis()
                         
                         # Notificar al cliente si hay uno asignado
@@ -178,8 +309,10 @@ class ECCentral:
 
                     # Esperar 10 segundos antes de considerarlo una incidencia permanente
                     time.sleep(10)
-                    taxi.status = "DOWN"
-                    taxi.auth_status = 0 
+                    with self.taxis_lock:
+                        taxi.status = "DOWN"
+                        taxi.auth_status = 0 
+                        self.update_taxi_cell(taxi)
                     logger.info(f"Marking taxi {taxi_id} as inactive on the map.")
                     break
 
@@ -226,8 +359,10 @@ class ECCentral:
             customer_assigned = update['customer_id']
             picked_off = update['picked_off']
             taxi_updated = self.update_taxi_state(taxi_id, pos_x, pos_y, status, color, customer_assigned, picked_off)
-            self.finalize_trip_if_needed(taxi_updated)
-            self.map_changed= True
+            handler = self.status_handlers.get(status)
+            if taxi_updated and handler:
+                handler(taxi_updated)
+            self.map_dirty.set()
         
         except KeyError as e:
             logger.error(f"Key error when processing update: missing key {e}")
@@ -238,16 +373,19 @@ class ECCentral:
     def update_taxi_state(self, taxi_id, pos_x, pos_y, status, color, customer_assigned, picked_off):
         """Actualiza la información del taxi en el sistema."""
         if taxi_id in self.taxis:
-            taxi = self.taxis[taxi_id]
-            taxi.position = (pos_x, pos_y)
-            taxi.status = status
-            taxi.color = color
-            taxi.customer_assigned = customer_assigned
-            taxi.picked_off = picked_off
-            self.map_changed = True  
+            with self.taxis_lock:
+                taxi = self.taxis[taxi_id]
+                taxi.position = (pos_x, pos_y)
+                taxi.status = status
+                taxi.color = color
+                taxi.customer_assigned = customer_assigned
+                taxi.picked_off = picked_off
+                self.update_taxi_cell(taxi)
+            self.map_dirty.set()
             self.save_taxis()
             if picked_off==1:
                 self.locations[customer_assigned].position = taxi.position 
+                self.locations_version += 1
                 self.customers[customer_assigned].picked_off = 1
                 self.customers[customer_assigned].status = "OK"
             return taxi
@@ -255,13 +393,12 @@ class ECCentral:
             logger.warning(f"No taxi found with id {taxi_id}")
             return None
 
-    def finalize_trip_if_needed(self, taxi):
-        """Notifica al cliente si el taxi ha finalizado el viaje."""
-        if taxi.status == "END":
-            self.map_changed = True
-            self.customers[taxi.customer_assigned].status = "SERVICED"
-            self.save_taxis()
-            self.notify_customer(taxi)
+    def finalize_trip(self, taxi):
+        """Marca el servicio como finalizado y notifica al cliente."""
+        self.map_dirty.set()
+        self.customers[taxi.customer_assigned].status = "SERVICED"
+        self.save_taxis()
+        self.notify_customer(taxi)
         
     def generate_table(self):
         """Genera la tabla de estado de taxis y clientes con el menú fijo 12 líneas debajo del título."""
@@ -337,13 +474,16 @@ class ECCentral:
     def stop_continue(self, taxi_id):
         if taxi_id in self.taxis:
             try:
+                # Alternar el estado de parada de forma atómica
+                with self.taxis_lock:
+                    stopped = not self.taxis[taxi_id].stopped
+                    self.taxis[taxi_id].stopped = stopped
 
-                if self.taxis[taxi_id].stopped ==  False:
+                if stopped:
                     instruction = {
                     'taxi_id': taxi_id,
                     'type': 'STOP',
                     }
-                    self.taxis[taxi_id].stopped = True
                     print(f"Central ordered the taxi {taxi_id} to STOP")
                     
                     notification = {
@@ -360,7 +500,6 @@ class ECCentral:
                     'taxi_id': taxi_id,
                     'type': 'RESUME',
                     }
-                    self.taxis[taxi_id].stopped = False
                     print(f"Central ordered the taxi {taxi_id} to CONTINUE")
 
                     notification = {
@@ -431,38 +570,40 @@ class ECCentral:
             else:
                 print(f"Destino {destination} no encontrado.")
 
-    def draw_map(self):
-        """Dibuja el mapa y la tabla de estado lado a lado en la consola."""
-        table = self.generate_table()
-
-        # Construir las líneas del mapa
-        map_lines = []
-        border_row = "#" * (self.map_size[1] * 2 + 2)
-        map_lines.append(border_row)
+    def put_map_cell(self, x, y, label):
+        """Escribe la etiqueta (máximo 2 caracteres) en la celda (x, y) del buffer del mapa."""
+        if 1 <= x <= self.map_size[1] and 1 <= y <= self.map_size[0]:
+            offset = y * self._map_row_len + 1 + (x - 1) * 2
+            self._map_buf[offset:offset + 2] = label.encode('ascii', 'replace')[:2].ljust(2)
 
-        bordered_map = np.full((self.map_size[0], self.map_size[1]), ' ', dtype=str)
+    def render_map(self):
+        """Actualiza el buffer del mapa con las localizaciones y los taxis actuales."""
+        # Reiniciar el buffer del mapa con bordes y celdas vacías
+        self._map_buf[:] = self._blank_template
 
-        # Colocar las localizaciones en el mapa
-        for location in self.locations.values():
+        # Colocar las localizaciones en el mapa (copia: el hilo de Kafka puede añadir clientes)
+        for location in list(self.locations.values()):
             x, y = location.position
-            bordered_map[y - 1, x - 1] = location.id.ljust(2)
+            self.put_map_cell(x, y, location.id)
+
+        # Colocar los taxis autenticados en el mapa con una única escritura vectorizada
+        # Leer los arrays con el lock para no mezclar la x nueva de un taxi con su y antigua
+        with self.taxis_lock:
+            x, y = self.taxi_x, self.taxi_y
+            drawn = self.taxi_visible & (x >= 1) & (x <= self.map_size[1]) & (y >= 1) & (y <= self.map_size[0])
+            offsets = y[drawn] * self._map_row_len + 1 + (x[drawn] - 1) * 2
+            labels = self.taxi_label[drawn]
+        cells = np.frombuffer(self._map_buf, dtype=np.uint8)
+        cells[offsets] = labels[:, 0]
+        cells[offsets + 1] = labels[:, 1]
+        del cells  # Liberar la vista para no bloquear el bytearray
 
-        # Colocar los taxis autenticados en el mapa
-        for taxi in self.taxis.values():
-            
-            x, y = taxi.position
-            if 1 <= x <= self.map_size[1] and 1 <= y <= self.map_size[0]:
-                if taxi.status == "DOWN":
-                    bordered_map[y - 1, x - 1] = "X "
-                elif taxi.auth_status == 1:
-                    bordered_map[y - 1, x - 1] = str(taxi.id).ljust(2)
-
-        # Añadir las filas al mapa
-        for row in bordered_map:
-            formatted_row = "#" + "".join([f"{cell} " if cell != " " else "  " for cell in row]) + "#"
-            map_lines.append(formatted_row)
+    def draw_map(self):
+        """Dibuja el mapa y la tabla de estado lado a lado en la consola."""
+        self.render_map()
+        table = self.generate_table()
 
-        map_lines.append(border_row)
+        map_lines = self._map_buf.decode('ascii').splitlines()
 
         # Dividir las líneas de la tabla
         table_lines = table.split("\n")
@@ -480,10 +621,38 @@ class ECCentral:
             for map_line, table_line in zip(padded_map_lines, padded_table_lines)
         ]
 
-        # Mostrar el resultado en la consola
-        print("\n".join(combined_lines))
+        # Mostrar el resultado en la consola solo si ha cambiado respecto a lo último mostrado
+        screen = "\n".join(combined_lines)
+        if screen != self.last_screen:
+            self.last_screen = screen
+            print(screen)
+
 
 
+    def build_map_payload(self):
+        """Serializa el estado actual del mapa, taxis y localizaciones a JSON.
+
+        Las localizaciones casi nunca cambian, así que su fragmento JSON se reutiliza
+        hasta que se modifican y el resto del mensaje se compone alrededor de él.
+        """
+        self.map_seq += 1
+        # Leer la versión antes de serializar: si cambia durante el volcado, se regenera en el siguiente envío
+        locations_version = self.locations_version
+        if locations_version != self.locations_json_version:
+            self.locations_json = orjson.dumps({k: {'position': v.position, 'color': v.color}
+                                                for k, v in list(self.locations.items())},
+                                               option=orjson.OPT_NON_STR_KEYS)
+            self.locations_json_version = locations_version
+        taxis_json = orjson.dumps({k: {'position': v.position, 'status': v.status, 'color': v.color}
+                                   for k, v in self.taxis.items()}, option=orjson.OPT_NON_STR_KEYS)
+        return b''.join((
+            b'{"epoch":', str(self.map_epoch).encode('ascii'),
+            b',"seq":', str(self.map_seq).encode('ascii'),
+            b',"map":', orjson.dumps(self._map_buf.decode('ascii')),
+            b',"taxis":', taxis_json,
+            b',"locations":', self.locations_json,
+            b'}'
+        ))
 
     def broadcast_map(self):
         """
@@ -491,14 +660,8 @@ class ECCentral:
         """
         if self.producer:
             try:
-                map_data = {
-                    'map': self.map.tolist(),
-                    'taxis': {k: {'position': v.position, 'status': v.status, 'color': v.color} 
-                                for k, v in self.taxis.items()},
-                    'locations': {k: {'position': v.position, 'color': v.color}
-                                    for k, v in self.locations.items()}
-                }
-                self.producer.send('map_updates', map_data)
+                # Clave fija: todas las actualizaciones van a la misma partición y llegan en orden
+                self.producer.send('map_updates', key=b'global', value=self.build_map_payload())
             except KafkaError as e:
                 logger.error(f"Error broadcasting map: {e}")
 
@@ -536,7 +699,8 @@ class ECCentral:
         if customer_location:
             location_key = tuple(customer_location)
             self.locations[customer_id] = Location(customer_id, location_key, 'YELLOW')
-            self.map_changed = True  
+            self.locations_version += 1
+            self.map_dirty.set()
 
         if destination not in self.locations:
             logger.error(f"Invalid destination: {destination}")
@@ -547,7 +711,7 @@ class ECCentral:
         available_taxi = self.select_available_taxi(customer_id)
         if available_taxi and available_taxi.status == "FREE":
             self.assign_taxi_to_customer(available_taxi, customer_id, location_key, destination)
-            self.map_changed = True  
+            self.map_dirty.set()
             return True
         else:
             logger.warning("No available taxis")
@@ -557,9 +721,9 @@ class ECCentral:
     def select_available_taxi(self,customer):
         """Selecciona el primer taxi disponible con estado 'FREE'."""
         while True:
-            self.load_taxis()
-
-            available_taxi = next((taxi for taxi in self.taxis.values() if taxi.status == 'FREE' and taxi.customer_assigned == "x" and taxi.auth_status==1), None)
+            # El estado en memoria es la referencia; solo se carga del fichero al arrancar
+            with self.taxis_lock:
+                available_taxi = next((taxi for taxi in self.taxis.values() if taxi.status == 'FREE' and taxi.customer_assigned == "x" and taxi.auth_status==1), None)
 
             # Log adicional para saber si se encontró un taxi disponible
             if available_taxi:
@@ -579,12 +743,13 @@ class ECCentral:
 
     def assign_taxi_to_customer(self, taxi, customer_id, customer_location, destination):
         """Asigna el taxi al cliente y envía instrucciones."""
-        taxi.status = 'BUSY'
-        taxi.color = 'GREEN'
-        taxi.customer_assigned = customer_id
+        with self.taxis_lock:
+            taxi.status = 'BUSY'
+            taxi.color = 'GREEN'
+            taxi.customer_assigned = customer_id
         self.save_taxis()
         self.update_customer(customer_id, taxi.id)
-        self.map_changed = True
+        self.map_dirty.set()
         self.notify_customer_assignment(customer_id, taxi)
         self.send_taxi_instruction(taxi, customer_id, customer_location, destination)
 
@@ -612,7 +777,6 @@ class ECCentral:
         }
         try:
             self.producer.send('taxi_responses', response)
-            self.producer.flush()
             logger.info(f"Confirmation sent to customer {customer_id}: {response}")
         except KafkaError as e:
             logger.error(f"Failed to send confirmation to customer {customer_id}: {e}")
@@ -628,7 +792,6 @@ class ECCentral:
 
             try:
                 self.producer.send('taxi_responses', notification)
-                self.producer.flush()
                 logger.info(f"The taxi sensor for the customer '{customer_id}' stopped working, notifying the customer: {notification}")
             except KafkaError as e:
                 logger.error(f"Failed to send confirmation to customer {customer_id}: {e}")
@@ -641,37 +804,47 @@ class ECCentral:
     def kafka_listener(self):
         while True:
             try:
-                for message in self.consumer:
-                    if message.topic == 'taxi_requests':
-                        data = message.value
-                        self.process_customer_request(data)
-                        
-                    elif message.topic == 'taxi_updates':
-                        data = message.value
-                        self.process_update(data)
-
+                # Recoger los mensajes por lotes en lugar de uno a uno
+                records = self.consumer.poll(timeout_ms=500, max_records=500)
             except KafkaError as e:
                 logger.error(f"Kafka listener error: {e}")
                 self.setup_kafka() 
                 time.sleep(5)
+                continue
             except Exception as e:
-                logger.error(f"General error in kafka_listener: {e} {message.topic}")
-                time.sleep(5) 
+                # Por ejemplo, un mensaje que no es JSON válido falla al deserializarse dentro de poll()
+                logger.error(f"General error in kafka_listener: {e}")
+                time.sleep(5)
+                continue
+
+            for messages in records.values():
+                for message in messages:
+                    # Un error en un mensaje no debe hacer perder el resto del lote ya consumido
+                    try:
+                        if message.topic == 'taxi_requests':
+                            data = message.value
+                            self.process_customer_request(data)
+                            
+                        elif message.topic == 'taxi_updates':
+                            data = message.value
+                            self.process_update(data)
+                    except Exception as e:
+                        logger.error(f"Error processing message from '{message.topic}' at offset {message.offset}: {e}")
 
     def auto_broadcast_map(self):
         """Envía el estado del mapa solo cuando ha habido cambios."""
         while True:
-            if self.map_changed:
-                time.sleep(1)
-                self.draw_map()
-                self.broadcast_map()
-                self.map_changed = False  
-            time.sleep(0.1)  
+            self.map_dirty.wait()
+            time.sleep(self.map_coalesce_delay)  # Agrupar cambios casi simultáneos
+            self.map_dirty.clear()
+            self.draw_map()
+            self.broadcast_map()
 
 
     def start_server_socket(self):
         """Configura el servidor de sockets y maneja la autenticación de taxis en un hilo separado."""
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server_socket.bind(('0.0.0.0', self.listen_port))
         self.server_socket.listen(5)  
         logger.info(f"Listening for taxi connections on port {self.listen_port}...")
@@ -679,7 +852,8 @@ class ECCentral:
         try:
             while True:
                 conn, addr = self.server_socket.accept()
-                threading.Thread(target=self.handle_taxi_auth, args=(conn, addr), daemon=True).start()
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.auth_pool.submit(self.handle_taxi_auth, conn, addr)
         except Exception as e:
             logger.error(f"Error in start_server_socket: {e}")
         finally:
@@ -690,6 +864,7 @@ class ECCentral:
         """Cierra el productor de Kafka con timeout."""
         if self.producer:
             try:
+                self.producer.flush(timeout=5.0)
                 self.producer.close(timeout=5.0)  
                 logger.info("Kafka producer closed successfully.")
             except KafkaError as e:
@@ -744,7 +919,7 @@ class ECCentral:
         # Mostrar el mapa inicial
         self.draw_map()
         self.broadcast_map()
-        self.map_changed = False
+        self.map_dirty.clear()
 
         # Iniciar hilos para las funcionalidades existentes
         auth_thread = threading.Thread(target=self.start_server_socket, daemon=True)
@@ -756,6 +931,9 @@ class ECCentral:
         map_thread = threading.Thread(target=self.auto_broadcast_map, daemon=True)
         map_thread.start()
 
+        self.persistence_thread = threading.Thread(target=self.taxi_persistence_loop, daemon=True)
+        self.persistence_thread.start()
+
         # Hilo para manejar inputs sin bloquear
         input_thread = threading.Thread(target=self.input_listener, daemon=True)
         input_thread.start()
@@ -765,6 +943,8 @@ class ECCentral:
                 time.sleep(1)  # Mantener el programa en ejecución
         except KeyboardInterrupt:
             logger.info("Shutting down...")
+            self.stop_taxi_persistence()
+            self.auth_pool.shutdown(wait=False)
             self.close_producer()
             if self.consumer:
                 self.consumer.close()
@@ -30,6 +30,7 @@ class DigitalEngine:
         self.customer_asigned = "x"
         self.locations = {}
         self.taxis = {}
+        self.map_version = None  # (epoch, seq) de la última actualización de mapa aplicada
         self.picked_off = 0
         self.central_disconnected = False
         self.sensor_connected = False  # Estado inicial de conexión del sensor
@@ -263,6 +264,13 @@ class DigitalEngine:
         Procesa las actualizaciones de mapa recibidas a través de Kafka y
         almacena las ubicaciones y taxis en los atributos de la clase.
         """
+        # Descartar mapas repetidos o más antiguos que el último aplicado
+        if 'seq' in message:
+            version = (message.get('epoch', 0), message['seq'])
+            if self.map_version is not None and version <= self.map_version:
+                return
+            self.map_version = version
+
         # Almacenar la última actualización del mapa y procesar ubicaciones y taxis
         self.locations = {loc_id: location for loc_id, location in message['locations'].items()}
         self.taxis = {taxi_id: taxi_info for taxi_id, taxi_info in message['taxis'].items()}